@@ -19,8 +19,11 @@ Optional:
 - AUTO_BAN (set to "1" to enable auto-ban behavior — not recommended until tested)
 """
 
-import os, asyncio, time, json, hmac, hashlib, tempfile
-import aiosqlite
+import os, asyncio, heapq, sqlite3, time, json, hmac, hashlib, secrets, tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+import orjson
 import discord
 from discord.ext import commands, tasks
 from aiohttp import web
@@ -42,8 +45,13 @@ MOD_LOG_CHANNEL_ID = int(os.getenv('MOD_LOG_CHANNEL_ID', '1416287627128078439'))
 
 VERIFY_BASE = os.getenv('VERIFY_BASE', 'http://localhost:5000')
 VERIFY_SECRET = os.getenv('VERIFY_SECRET', 'please_set_verify_secret')   # must match web.py
+VERIFY_SECRET_BYTES = VERIFY_SECRET.encode()
 ADMIN_SECRET = os.getenv('ADMIN_SECRET', 'please_set_admin_secret')
 
+def _sign_token(token: str) -> str:
+    """HMAC hex a token once at issuance; web.py forwards the stored value."""
+    return hmac.digest(VERIFY_SECRET_BYTES, token.encode(), 'sha256').hex()
+
 QUARANTINE_THRESHOLD = int(os.getenv('QUARANTINE_THRESHOLD', '60'))
 QUARANTINE_HOURS = int(os.getenv('QUARANTINE_HOURS', '24'))
 AUTO_BAN = os.getenv('AUTO_BAN', '0') == '1'
@@ -56,12 +64,82 @@ intents.members = True
 intents.message_content = False
 bot = commands.Bot(command_prefix='!', intents=intents)
 
-recent_joins = []
+recent_joins = deque(maxlen=4096)
 surge_mode = False
+SURGE_WINDOW = 30
+_surge_recheck_task = None
+
+# quarantine expiries live in a min-heap; a single waiter task sleeps until
+# the earliest until_ts instead of polling the DB every minute
+_quarantine_heap = []
+_quarantine_event = asyncio.Event()
+
+# SQLite allows many readers but only one writer under WAL; serialize direct
+# writes on the shared connection through this lock.
+db_write_lock = asyncio.Lock()
+
+# ip_info rarely changes within a join surge; serve repeat verifications from
+# this cache instead of re-resolving per token (15 min TTL)
+_ip_info_cache = TTLCache(maxsize=10000, ttl=900)
+
+DB_PRAGMAS = (
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    'temp_store=MEMORY',
+    'mmap_size=268435456',
+    'cache_size=-65536',
+    # the web process writes the same WAL database; without a busy timeout
+    # (sqlite3 default is 0) any overlap with its commits raises
+    # "database is locked" immediately. Matches db.py's pool setting.
+    'busy_timeout=5000',
+)
+
+class BotDB:
+    """Direct sqlite3 wrapper running statements on a small thread pool.
+
+    aiosqlite funnels every statement through a queue + dedicated thread;
+    for the sub-millisecond index probes the bot issues that per-call
+    overhead dominates the query itself. sqlite3 in serialized mode is safe
+    to share across threads, and its built-in statement cache gives us
+    prepared statements without re-parsing hot SQL.
+    """
+    def __init__(self, path: str, workers: int = 4):
+        self._conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='botdb')
+        for pragma in DB_PRAGMAS:
+            self._conn.execute(f'PRAGMA {pragma}')
+
+    def _fetchone(self, sql, args):
+        return self._conn.execute(sql, args).fetchone()
+
+    def _executemany(self, sql, rows):
+        self._conn.executemany(sql, rows)
+        self._conn.commit()
+
+    def _execute(self, sql, args):
+        self._conn.execute(sql, args)
+        self._conn.commit()
+
+    async def fetchone(self, sql, args=()):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._fetchone, sql, args)
+
+    async def execute(self, sql, args=()):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._pool, self._execute, sql, args)
 
-# Helper: send to mod log
+    async def executemany(self, sql, rows):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._pool, self._executemany, sql, rows)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        self._conn.close()
+
+# Helper: send to mod log (channel resolved once at on_ready; mod_log runs
+# on every verification so the per-call cache walk adds up)
 async def mod_log(text):
-    ch = bot.get_channel(MOD_LOG_CHANNEL_ID)
+    ch = getattr(bot, '_mod_log_ch', None) or bot.get_channel(MOD_LOG_CHANNEL_ID)
     if ch:
         try:
             await ch.send(text)
@@ -70,9 +148,65 @@ async def mod_log(text):
     else:
         print("mod_log channel not available; fallback:", text)
 
+# -----------------------
+# Write-behind action log
+# -----------------------
+# Audit rows don't need their own fsync each; buffer them and batch into a
+# single transaction once a second.
+_actions_buffer = []
+
+def add_action_buffered(discord_id: str, action: str, reason: str, ip=None, fp=None):
+    _actions_buffer.append((discord_id, action, reason or '', ip, fp, int(time.time())))
+
+async def _flush_actions_once():
+    if not _actions_buffer:
+        return
+    rows = _actions_buffer[:]
+    del _actions_buffer[:len(rows)]
+    try:
+        async with db_write_lock:
+            await bot.db_conn.executemany(
+                "INSERT INTO actions (discord_id, action, reason, ip, fp, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+    except BaseException:
+        # put the batch back so the next tick retries instead of dropping
+        # this second's audit rows on a transient write failure
+        _actions_buffer[:0] = rows
+        raise
+
+async def flush_actions():
+    while True:
+        await asyncio.sleep(1)
+        try:
+            await _flush_actions_once()
+        except Exception as e:
+            print("flush_actions error:", e)
+
+# -----------------------
+# Verification worker pool
+# -----------------------
+# Bounded queue + fixed worker count so a webhook flood cannot spawn an
+# unbounded number of tasks each holding DB/Discord work.
+VERIFY_WORKERS = 8
+verify_queue = asyncio.Queue(maxsize=500)
+
+async def verify_worker():
+    while True:
+        token = await verify_queue.get()
+        try:
+            await process_verification_token(token)
+        except Exception as e:
+            print("verify_worker error:", e)
+        finally:
+            verify_queue.task_done()
+
 # -----------------------
 # Internal aiohttp server (bot side)
 # -----------------------
+# the webhook body is a single token; anything bigger is garbage
+MAX_VERIFY_BODY = 512
+
 async def handle_verify_request(request):
     """
     Expect:
@@ -80,16 +214,25 @@ async def handle_verify_request(request):
       - Header: X-Signature: hex(hmac_sha256(VERIFY_SECRET, token))
     """
     try:
-        body = await request.json()
-        token = body.get('token')
+        if request.content_length and request.content_length > MAX_VERIFY_BODY:
+            return web.json_response({'ok': False, 'error': 'payload too large'}, status=413)
+        raw = await request.content.read(MAX_VERIFY_BODY)
+        try:
+            body = orjson.loads(raw)
+        except Exception:
+            return web.json_response({'ok': False, 'error': 'bad json'}, status=400)
+        token = body.get('token') if isinstance(body, dict) else None
         sig = request.headers.get('X-Signature', '')
         if not token:
             return web.json_response({'ok': False, 'error': 'no token'}, status=400)
-        expected = hmac.new(VERIFY_SECRET.encode(), token.encode(), hashlib.sha256).hexdigest()
+        expected = hmac.new(VERIFY_SECRET_BYTES, token.encode(), hashlib.sha256).hexdigest()
         if not hmac.compare_digest(expected, sig):
             return web.json_response({'ok': False, 'error': 'invalid signature'}, status=403)
-        # schedule processing
-        asyncio.create_task(process_verification_token(token))
+        # enqueue for the worker pool; shed load instead of queueing unbounded
+        try:
+            verify_queue.put_nowait(token)
+        except asyncio.QueueFull:
+            return web.json_response({'ok': False, 'error': 'busy'}, status=503)
         return web.json_response({'ok': True})
     except Exception as e:
         print("handle_verify_request error:", e)
@@ -98,7 +241,8 @@ async def handle_verify_request(request):
 async def start_internal_server():
     app = web.Application()
     app.router.add_post('/verify', handle_verify_request)
-    runner = web.AppRunner(app)
+    # no per-request access-log formatting on the internal loopback hop
+    runner = web.AppRunner(app, access_log=None)
     await runner.setup()
     site = web.TCPSite(runner, '127.0.0.1', 5001)
     await site.start()
@@ -115,88 +259,67 @@ async def process_verification_token(token: str):
         if not v:
             print("Token not found:", token)
             return
-        _, discord_id_str, _, status, used, created_at, expires_at = v
+        _, discord_id_str, _, status, used, created_at, expires_at, _sig = v
         now_ts = int(time.time())
         if expires_at and now_ts > expires_at:
             print("Token expired:", token)
-            await db.add_action(discord_id_str, 'token_expired', token)
+            add_action_buffered(discord_id_str, 'token_expired', token)
             return
         if used:
             print("Token already used:", token)
-            await db.add_action(discord_id_str, 'token_reuse', token)
+            add_action_buffered(discord_id_str, 'token_reuse', token)
             return
 
-        # fetch fingerprints for token
-        fp_rows_raw = await db.fetch_fingerprints_by_token(token)  # list of tuples
-        fp_rows = []
-        for r in fp_rows_raw:
-            # r: (id, token, fp_json, ip, asn, ua, honeypot, created_at)
-            fp_json = r[2]
-            try:
-                parsed = json.loads(fp_json) if fp_json else {}
-            except Exception:
-                parsed = {}
-            dna = parsed.get('dna', {})
-            ip_info_stored = parsed.get('ip_info', {}) if isinstance(parsed, dict) else {}
-            fp_obj = {
-                'fp': parsed.get('fp') or parsed,
-                'ip': r[3],
-                'asn': r[4] or ip_info_stored.get('asn'),
-                'ua': r[5],
-                'honeypot': bool(r[6]),
-                'dna': dna,
-                'ip_info': ip_info_stored
-            }
-            fp_rows.append(fp_obj)
+        # newest fingerprint, pre-parsed at the DB boundary, plus the
+        # honeypot aggregate — no JSON work on this side
+        fp_rows, honeypot_any = await db.load_fp_rows(token)
 
         # compute db_stats (counts of same IP / same FP / previous bans)
-        same_ip_count = 0
-        same_fp_count = 0
-        previous_bans = 0
+        ip_val = None
+        fp_val = None
         if fp_rows:
             # use the first fingerprint as the "current"
             cur_fp = fp_rows[0]
             ip_val = cur_fp.get('ip')
             fp_val = json.dumps(cur_fp.get('fp')) if isinstance(cur_fp.get('fp'), (dict, list)) else str(cur_fp.get('fp'))
-            async with aiosqlite.connect('aegisx_s.db') as conn:
-                if ip_val:
-                    cur = await conn.execute('SELECT COUNT(DISTINCT token) FROM fingerprints WHERE ip = ? AND token != ?', (ip_val, token))
-                    r = await cur.fetchone()
-                    same_ip_count = int(r[0]) if r and r[0] else 0
-                if fp_val:
-                    cur = await conn.execute('SELECT COUNT(DISTINCT token) FROM fingerprints WHERE fp = ? AND token != ?', (fp_val, token))
-                    r = await cur.fetchone()
-                    same_fp_count = int(r[0]) if r and r[0] else 0
-                # previous bans heuristic: count actions where action contains 'ban'
-                if ip_val or fp_val:
-                    # crude previous ban search in actions.reason (demo-level)
-                    cur = await conn.execute("SELECT COUNT(*) FROM actions WHERE action = 'ban' AND (reason LIKE ? OR reason LIKE ?)", (f'%{ip_val}%', f'%{fp_val}%'))
-                    r = await cur.fetchone()
-                    previous_bans = int(r[0]) if r and r[0] else 0
-
-        db_stats = {'same_ip_count': same_ip_count, 'same_fp_count': same_fp_count, 'previously_banned_count': previous_bans}
-
-        # known dna profiles
-        known_profiles = await db.fetch_all_dna_profiles()
-
-        # ip_info: try to take from fp_rows first (stored ip_info), otherwise basic empty
-        ip_info = {}
-        if fp_rows and fp_rows[0].get('ip_info'):
+            # canonical 16-byte hash: stable across key order and cheap to
+            # compare in the index, unlike the raw JSON string
+            fp_hash_val = db.fp_hash(cur_fp.get('fp')) if cur_fp.get('fp') is not None else b''
+            stats_coro = db.compute_db_stats(ip_val or '', fp_hash_val, fp_val or '', token)
+            # stats and the DNA profile load are independent — overlap them
+            # instead of paying both latencies back to back (profiles only
+            # matter when this submission carries DNA)
+            if cur_fp.get('dna'):
+                db_stats, known_profiles = await asyncio.gather(stats_coro, db.fetch_all_dna_profiles())
+            else:
+                db_stats = await stats_coro
+                known_profiles = []
+        else:
+            db_stats = {'same_ip_count': 0, 'same_fp_count': 0, 'previously_banned_count': 0}
+            known_profiles = []
+
+        # ip_info: cached by IP, then stored fingerprint, otherwise basic empty
+        if ip_val and ip_val in _ip_info_cache:
+            ip_info = _ip_info_cache[ip_val]
+        elif fp_rows and fp_rows[0].get('ip_info'):
             ip_info = fp_rows[0].get('ip_info') or {}
+            if ip_val:
+                _ip_info_cache[ip_val] = ip_info
         else:
             ip_info = {'is_datacenter': False, 'is_vpn': False, 'is_tor': False, 'proxy_score': 0, 'asn': None}
 
-        honeypot_triggered = any(r.get('honeypot') for r in fp_rows)
+        honeypot_triggered = bool(honeypot_any)
 
         # find member
-        guild = bot.get_guild(GUILD_ID)
+        guild = getattr(bot, '_guild', None) or bot.get_guild(GUILD_ID)
         if not guild:
             print("Guild not available on bot.")
             return
         member = guild.get_member(int(discord_id_str))
         account_age_days = 9999
         if member:
-            account_age_days = max(0, (discord.utils.utcnow() - member.created_at).days)
+            # plain float math; no tz-aware datetime/timedelta allocations
+            account_age_days = max(0, int((time.time() - member.created_at.timestamp()) / 86400))
 
         # compute risk via detection
         risk = detection.compute_risk(fp_rows, known_profiles, ip_info, honeypot_triggered, account_age_days, social_scores=None, db_stats=db_stats)
@@ -206,12 +329,12 @@ async def process_verification_token(token: str):
         # mark token used (prevent replay) BEFORE role ops
         await db.mark_token_used(token)
 
-        # apply decisions
-        vrole = guild.get_role(VERIFY_ROLE_ID)
-        qrole = guild.get_role(QUARANTINE_ROLE_ID)
+        # apply decisions (roles cached at on_ready; fall back if cache is cold)
+        vrole = getattr(bot, '_vrole', None) or guild.get_role(VERIFY_ROLE_ID)
+        qrole = getattr(bot, '_qrole', None) or guild.get_role(QUARANTINE_ROLE_ID)
 
         if not member:
-            await db.add_action(discord_id_str, 'verify_no_member', f"token={token};score={score}")
+            add_action_buffered(discord_id_str, 'verify_no_member', f"token={token};score={score}")
             await mod_log(f"Verification submitted for <@{discord_id_str}> but member not found in guild.")
             return
 
@@ -219,16 +342,19 @@ async def process_verification_token(token: str):
             # quarantine (timebomb)
             try:
                 if qrole:
-                    await member.add_roles(qrole, reason=f"Auto-quarantine score={score}")
+                    # single PATCH carrying the full role set; batches any
+                    # future multi-role changes into one REST call
+                    await member.edit(roles=list(set(member.roles) | {qrole}), reason=f"Auto-quarantine score={score}")
                 until_ts = int(time.time()) + QUARANTINE_HOURS * 3600
                 await db.quarantine_member(str(member.id), until_ts)
-                await db.add_action(str(member.id), 'quarantine_auto', f"score={score};reasons={reasons}")
+                track_quarantine(str(member.id), until_ts)
+                add_action_buffered(str(member.id), 'quarantine_auto', f"score={score};reasons={reasons}")
                 await mod_log(f"👮 {member.mention} automatically quarantined (score={score}). Reasons: {reasons}")
                 # optionally auto-ban on extremely high score if enabled
                 if AUTO_BAN and score >= 95:
                     try:
                         await member.ban(reason=f"Auto-ban (score {score})")
-                        await db.add_action(str(member.id), 'ban', f"auto-ban score={score}")
+                        add_action_buffered(str(member.id), 'ban', f"auto-ban score={score}", ip=ip_val, fp=fp_val)
                         await mod_log(f"🔨 {member.mention} auto-banned (score {score}).")
                     except Exception as e:
                         print("Auto-ban failed:", e)
@@ -238,16 +364,12 @@ async def process_verification_token(token: str):
             # assign verified
             try:
                 if vrole:
-                    await member.add_roles(vrole, reason=f"Verified score={score}")
+                    await member.edit(roles=list(set(member.roles) | {vrole}), reason=f"Verified score={score}")
                 await db.set_verification_status(token, 'verified')
-                await db.add_action(str(member.id), 'verified', f"score={score};reasons={reasons}")
+                add_action_buffered(str(member.id), 'verified', f"score={score};reasons={reasons}")
                 await mod_log(f"✅ {member.mention} verified (score={score}).")
                 # store dna profile if not exists
-                exists = False
-                for p in known_profiles:
-                    if p.get('discord_id') == str(member.id):
-                        exists = True
-                        break
+                exists = await db.dna_profile_exists(str(member.id))
                 if not exists and fp_rows and fp_rows[0].get('dna'):
                     typing_profile = fp_rows[0]['dna'].get('typing', [])
                     mouse_profile = fp_rows[0]['dna'].get('mouse', [])
@@ -264,50 +386,147 @@ async def process_verification_token(token: str):
 async def on_ready():
     print("Bot connected:", bot.user)
     await db.init_db()
-    surge_check.start()
-    quarantine_check.start()
+    # one long-lived connection; reopening per request throws away the page
+    # cache and pays open/fsync cost on every verification
+    if getattr(bot, 'db_conn', None) is None:
+        bot.db_conn = BotDB('aegisx_s.db')
+    # pooled HTTP session: keepalive + DNS cache instead of a fresh
+    # handshake per outbound call
+    if getattr(bot, 'http_session', None) is None:
+        bot.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=50, ttl_dns_cache=300, use_dns_cache=True),
+            timeout=aiohttp.ClientTimeout(total=20)
+        )
+    if not getattr(bot, '_verify_workers', None):
+        bot._verify_workers = [asyncio.create_task(verify_worker()) for _ in range(VERIFY_WORKERS)]
+    if not getattr(bot, '_action_flusher', None):
+        bot._action_flusher = asyncio.create_task(flush_actions())
+    if not purge_expired.is_running():
+        purge_expired.start()
+    # resolve guild/role/channel objects once; per-verification lookups are
+    # wasted work (refreshed by the update listeners below)
+    guild = bot.get_guild(GUILD_ID)
+    bot._guild = guild
+    bot._mod_log_ch = bot.get_channel(MOD_LOG_CHANNEL_ID)
+    if guild:
+        bot._vrole = guild.get_role(VERIFY_ROLE_ID)
+        bot._qrole = guild.get_role(QUARANTINE_ROLE_ID)
+    # settle anything that expired while we were down, then seed the heap
+    # with the still-active rows only
+    if not getattr(bot, '_quarantine_waiter', None):
+        now_ts = int(time.time())
+        for discord_id, _ in await db.get_expired_quarantined(now_ts):
+            await _expire_quarantine(discord_id)
+        for discord_id, until_ts in await db.get_active_quarantined(now_ts):
+            heapq.heappush(_quarantine_heap, (int(until_ts), discord_id))
+        if _quarantine_heap:
+            _quarantine_event.set()
+        bot._quarantine_waiter = asyncio.create_task(quarantine_waiter())
     # start internal webhook server
     asyncio.create_task(start_internal_server())
 
-@tasks.loop(seconds=10)
-async def surge_check():
+async def _maybe_update_surge():
+    """Re-evaluate surge state from the join window.
+    Called on each join, and once more when the oldest join can age out,
+    rather than on a fixed 10s poll."""
     global surge_mode
     now = time.time()
-    window = 30
-    while recent_joins and recent_joins[0] < now - window:
-        recent_joins.pop(0)
+    while recent_joins and recent_joins[0] < now - SURGE_WINDOW:
+        recent_joins.popleft()
     if len(recent_joins) >= 3 and not surge_mode:
         surge_mode = True
         await mod_log('⚠️ Surge detected: multiple joins. Entering Surge Mode.')
     elif len(recent_joins) == 0 and surge_mode:
         surge_mode = False
         await mod_log('✅ Surge ended.')
+    if recent_joins:
+        _schedule_surge_recheck(recent_joins[0] + SURGE_WINDOW - now)
+
+def _schedule_surge_recheck(delay: float):
+    global _surge_recheck_task
+    if _surge_recheck_task is None or _surge_recheck_task.done():
+        _surge_recheck_task = asyncio.create_task(_surge_recheck(delay))
+
+async def _surge_recheck(delay: float):
+    global _surge_recheck_task
+    await asyncio.sleep(max(0.0, delay))
+    _surge_recheck_task = None
+    await _maybe_update_surge()
+
+def track_quarantine(discord_id: str, until_ts: int):
+    """Register an expiry with the waiter task."""
+    heapq.heappush(_quarantine_heap, (int(until_ts), discord_id))
+    _quarantine_event.set()
+
+async def quarantine_waiter():
+    """Sleep until the next quarantine expiry instead of polling every 60s."""
+    while True:
+        try:
+            if not _quarantine_heap:
+                _quarantine_event.clear()
+                await _quarantine_event.wait()
+                continue
+            now = int(time.time())
+            until_ts, discord_id = _quarantine_heap[0]
+            if until_ts > now:
+                _quarantine_event.clear()
+                try:
+                    # a newly tracked entry may expire sooner; re-examine on wake
+                    await asyncio.wait_for(_quarantine_event.wait(), timeout=until_ts - now)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            heapq.heappop(_quarantine_heap)
+            await _expire_quarantine(discord_id)
+        except Exception as e:
+            print("quarantine_waiter error:", e)
+            await asyncio.sleep(5)
 
-@tasks.loop(seconds=60)
-async def quarantine_check():
-    rows = await db.get_quarantined()
-    now = int(time.time())
+async def _expire_quarantine(discord_id: str):
     guild = bot.get_guild(GUILD_ID)
-    for row in rows:
-        discord_id, until_ts = row
-        if until_ts <= now:
-            member = guild.get_member(int(discord_id)) if guild else None
-            if member:
-                qrole = guild.get_role(QUARANTINE_ROLE_ID)
-                if qrole in member.roles:
-                    try:
-                        await member.remove_roles(qrole, reason='Quarantine expired.')
-                    except:
-                        pass
-            await db.add_action(discord_id, 'quarantine_expired', 'Auto-unquarantine after expiration.')
+    member = guild.get_member(int(discord_id)) if guild else None
+    if member:
+        qrole = getattr(bot, '_qrole', None) or (guild.get_role(QUARANTINE_ROLE_ID) if guild else None)
+        if qrole in member.roles:
+            try:
+                await member.remove_roles(qrole, reason='Quarantine expired.')
+            except:
+                pass
+    await db.remove_quarantine(discord_id)
+    await db.add_action(discord_id, 'quarantine_expired', 'Auto-unquarantine after expiration.')
+
+@tasks.loop(minutes=30)
+async def purge_expired():
+    """Drop long-dead unused verifications so token lookups stay on shallow B-trees."""
+    cutoff = int(time.time()) - 86400
+    try:
+        async with db_write_lock:
+            await bot.db_conn.execute('DELETE FROM verifications WHERE used = 0 AND expires_at < ?', (cutoff,))
+            await bot.db_conn.execute('PRAGMA incremental_vacuum')
+        await db.checkpoint_wal()
+    except Exception as e:
+        print("purge_expired error:", e)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    if after.id == MOD_LOG_CHANNEL_ID:
+        bot._mod_log_ch = after
+
+@bot.event
+async def on_guild_role_update(before, after):
+    if after.id == VERIFY_ROLE_ID:
+        bot._vrole = after
+    elif after.id == QUARANTINE_ROLE_ID:
+        bot._qrole = after
 
 @bot.event
 async def on_member_join(member: discord.Member):
     if member.guild.id != GUILD_ID:
         return
     recent_joins.append(time.time())
+    await _maybe_update_surge()
     token = secrets.token_urlsafe(18)
-    await db.create_verification(token, str(member.id), expires_seconds=600)
+    await db.create_verification(token, str(member.id), expires_seconds=600, sig=_sign_token(token))
     link = VERIFY_BASE.rstrip('/') + f"/start/{token}"
     ch = bot.get_channel(MOD_LOG_CHANNEL_ID)
     if ch:
@@ -334,16 +553,16 @@ async def export_verifications(ctx):
     export_url = VERIFY_BASE.rstrip('/') + '/admin/export'
     params = {'secret': admin_secret}
     try:
-        async with aiohttp.ClientSession() as s:
-            async with s.get(export_url, params=params, timeout=20) as resp:
-                if resp.status != 200:
-                    return await ctx.send("Failed to fetch export (status %s)." % resp.status)
-                text = await resp.text()
-        # send as file
-        with tempfile.NamedTemporaryFile('w+', delete=False, suffix='.csv') as tf:
-            tf.write(text)
-            tf.flush()
-            await ctx.author.send(file=discord.File(tf.name, filename='verifications.csv'))
+        async with bot.http_session.get(export_url, params=params) as resp:
+            if resp.status != 200:
+                return await ctx.send("Failed to fetch export (status %s)." % resp.status)
+            # stream response chunks straight to disk; peak memory stays at
+            # one chunk instead of the whole CSV
+            with tempfile.NamedTemporaryFile('wb', delete=False, suffix='.csv') as tf:
+                async for chunk in resp.content.iter_chunked(65536):
+                    tf.write(chunk)
+                path = tf.name
+        await ctx.author.send(file=discord.File(path, filename='verifications.csv'))
         await ctx.send("CSV exported and sent to your DMs.")
     except Exception as e:
         await ctx.send(f"Export failed: {e}")
@@ -353,7 +572,7 @@ async def export_verifications(ctx):
 @commands.has_permissions(manage_guild=True)
 async def verifynow(ctx, member: discord.Member):
     token = secrets.token_urlsafe(18)
-    await db.create_verification(token, str(member.id), expires_seconds=600)
+    await db.create_verification(token, str(member.id), expires_seconds=600, sig=_sign_token(token))
     link = VERIFY_BASE.rstrip('/') + f"/start/{token}"
     await mod_log(f"{member.mention}, please verify here: {link}")
     await ctx.send("Verification link posted to mod-log channel.")
@@ -361,27 +580,40 @@ async def verifynow(ctx, member: discord.Member):
 @bot.command()
 @commands.has_permissions(manage_guild=True)
 async def scan(ctx, member: discord.Member):
-    async with aiosqlite.connect('aegisx_s.db') as conn:
-        cur = await conn.execute(
-            'SELECT v.discord_id, f.fp, f.ip, f.asn, f.ua, f.honeypot '
-            'FROM verifications v LEFT JOIN fingerprints f ON v.token=f.token '
-            'WHERE v.discord_id = ? ORDER BY f.created_at DESC LIMIT 1',
-            (str(member.id),)
-        )
-        row = await cur.fetchone()
-        if not row:
-            await ctx.send('No verification/fingerprint found for that user.')
-            return
-        discord_id, fp, ip, asn, ua, honeypot = row
-        embed = discord.Embed(title='Quick Scan', color=discord.Color.orange())
-        embed.add_field(name='Discord ID', value=str(discord_id), inline=False)
-        embed.add_field(name='Fingerprint', value=str(fp or 'N/A'), inline=True)
-        embed.add_field(name='IP', value=str(ip or 'N/A'), inline=True)
-        embed.add_field(name='ASN', value=str(asn or 'N/A'), inline=False)
-        embed.add_field(name='Honeypot', value='Yes' if honeypot else 'No', inline=True)
-        await ctx.send(embed=embed)
+    row = await bot.db_conn.fetchone(
+        'SELECT v.discord_id, f.fp, f.ip, f.asn, f.ua, f.honeypot '
+        'FROM verifications v LEFT JOIN fingerprints f ON v.token=f.token '
+        'WHERE v.discord_id = ? ORDER BY f.created_at DESC LIMIT 1',
+        (str(member.id),)
+    )
+    if not row:
+        await ctx.send('No verification/fingerprint found for that user.')
+        return
+    discord_id, fp, ip, asn, ua, honeypot = row
+    embed = discord.Embed(title='Quick Scan', color=discord.Color.orange())
+    embed.add_field(name='Discord ID', value=str(discord_id), inline=False)
+    embed.add_field(name='Fingerprint', value=str(fp or 'N/A'), inline=True)
+    embed.add_field(name='IP', value=str(ip or 'N/A'), inline=True)
+    embed.add_field(name='ASN', value=str(asn or 'N/A'), inline=False)
+    embed.add_field(name='Honeypot', value='Yes' if honeypot else 'No', inline=True)
+    await ctx.send(embed=embed)
 
 # -----------------------
 # Run
 # -----------------------
-bot.run(TOKEN)
+try:
+    bot.run(TOKEN)
+finally:
+    # flush first — audit rows matter more than a clean session close
+    if getattr(bot, 'db_conn', None) is not None:
+        if _actions_buffer:
+            try:
+                asyncio.run(_flush_actions_once())
+            except Exception as e:
+                print("shutdown action flush failed:", e)
+        bot.db_conn.close()
+    if getattr(bot, 'http_session', None) is not None:
+        try:
+            asyncio.run(bot.http_session.close())
+        except Exception:
+            pass
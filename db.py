@@ -4,33 +4,128 @@ Async SQLite helper for AegisX-S.
 
 Provides:
 - init_db()
+- atomic()
 - create_verification(token, discord_id, expires_seconds=600)
 - get_verification(token)
+- get_status(token)
 - mark_token_used(token)
 - set_verification_status(token, status)
 - save_fingerprint(token, fp, ip, asn, ua, honeypot)
+- save_fingerprints_many(rows)
+- submit_fingerprint_if_valid(token, fp, ip, asn, ua, honeypot)
+- add_actions_many(rows)
 - fetch_fingerprints_by_token(token)
+- fetch_fingerprint_summary(token)
+- load_fp_rows(token)
+- compute_db_stats(ip, fph, fp, token)
 - save_dna_profile(discord_id, typing_profile, mouse_profile)
 - fetch_all_dna_profiles()
+- dna_profile_exists(discord_id)
 - add_action(discord_id, action, reason)
 - quarantine_member(discord_id, until_ts)
+- remove_quarantine(discord_id)
 - get_quarantined()
+- get_expired_quarantined(now_ts)
+- get_active_quarantined(now_ts)
 """
 
+import asyncio
 import aiosqlite
+import hashlib
 import time
 import json
+import orjson
+import numpy as np
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Optional, List, Dict, Tuple
 
 DB_PATH = Path("aegisx_s.db")
 
+# -----------------------
+# Connection pool
+# -----------------------
+class _ConnectionPool:
+    """
+    Small async pool of long-lived aiosqlite connections.
+
+    Opening a fresh connection per helper call pays syscall + pragma setup
+    and throws away SQLite's page cache each time; reusing warm connections
+    keeps the cache hot. Connections are created lazily up to pool_size.
+    """
+    PRAGMAS = (
+        'journal_mode=WAL',
+        'synchronous=NORMAL',
+        'wal_autocheckpoint=1000',
+        'mmap_size=268435456',
+        'temp_store=MEMORY',
+        'cache_size=-20000',
+        'busy_timeout=5000',
+    )
+
+    def __init__(self, path, pool_size: int = 8):
+        self._path = path
+        self._size = pool_size
+        self._created = 0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._grow_lock = asyncio.Lock()
+
+    async def _new_conn(self):
+        conn = await aiosqlite.connect(self._path)
+        for pragma in self.PRAGMAS:
+            await conn.execute(f'PRAGMA {pragma}')
+        return conn
+
+    async def _acquire(self):
+        if self._queue.empty() and self._created < self._size:
+            async with self._grow_lock:
+                if self._created < self._size:
+                    self._created += 1
+                    return await self._new_conn()
+        return await self._queue.get()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self._acquire()
+        try:
+            yield conn
+        finally:
+            self._queue.put_nowait(conn)
+
+    async def close(self):
+        while self._created:
+            conn = await self._queue.get()
+            await conn.close()
+            self._created -= 1
+
+POOL: Optional[_ConnectionPool] = None
+
+def _pool() -> _ConnectionPool:
+    global POOL
+    if POOL is None:
+        POOL = _ConnectionPool(DB_PATH)
+    return POOL
+
+def pooled_connection():
+    """Async context manager yielding a pooled connection for ad-hoc queries."""
+    return _pool().connection()
+
+async def close_pool():
+    """Shutdown hook: close every pooled connection."""
+    if POOL is not None:
+        await POOL.close()
+
 async def init_db(schema_path: str = "schema.sql"):
     """
     Initialize the SQLite DB using schema.sql. Safe to call multiple times.
     """
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     async with aiosqlite.connect(DB_PATH) as db:
+        # WAL + NORMAL sync: far fewer fsyncs per commit and readers no
+        # longer serialize behind the writer (journal_mode is persistent,
+        # the rest re-applied on every pooled connection)
+        for pragma in _ConnectionPool.PRAGMAS:
+            await db.execute(f'PRAGMA {pragma}')
         # Read schema file and execute
         try:
             with open(schema_path, "r", encoding="utf-8") as f:
@@ -40,44 +135,108 @@ async def init_db(schema_path: str = "schema.sql"):
         except FileNotFoundError:
             # If no schema file is present, assume DB is already created. Raise for visibility.
             raise
+    _pool()
+
+# SQLite has a single writer; funnel explicit transactions through one lock
+# so concurrent flows don't stack up on busy_timeout
+_write_lock = asyncio.Lock()
+
+@asynccontextmanager
+async def atomic():
+    """
+    Group several statements into one BEGIN IMMEDIATE transaction on a
+    pooled connection — the whole flow costs one commit/fsync. Usage:
+
+        async with atomic() as conn:
+            await conn.execute(...)
+            await conn.execute(...)
+    """
+    async with _write_lock:
+        async with _pool().connection() as conn:
+            await conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                await conn.execute('ROLLBACK')
+                raise
+            await conn.commit()
+
+async def checkpoint_wal():
+    """
+    Fold the WAL back into the main DB and truncate it. Call periodically
+    from a background task to bound WAL file growth under sustained writes.
+    """
+    async with _pool().connection() as db:
+        await db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
 
 # -----------------------
 # Verification lifecycle
 # -----------------------
-async def create_verification(token: str, discord_id: str, expires_seconds: int = 600):
+async def create_verification(token: str, discord_id: str, expires_seconds: int = 600, sig: Optional[str] = None):
     """
     Create a new verification row for a discord_id with a token.
     expires_seconds: lifespan of token in seconds (default 10 minutes).
+    sig: optional HMAC of the token computed once at issuance, so the web
+    layer can forward it instead of re-deriving it per submit.
     """
     ts = int(time.time())
     expires = ts + int(expires_seconds) if expires_seconds else None
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool().connection() as db:
         await db.execute(
-            "INSERT INTO verifications (discord_id, token, status, used, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
-            (discord_id, token, "pending", 0, ts, expires)
+            "INSERT INTO verifications (discord_id, token, status, used, sig, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (discord_id, token, "pending", 0, sig, ts, expires)
         )
         await db.commit()
 
+# hot statements as module constants: identical SQL text on every call keeps
+# sqlite3's built-in prepared-statement cache warm (never f-string these)
+_GET_VERIFICATION_SQL = "SELECT id, discord_id, token, status, used, created_at, expires_at, sig FROM verifications WHERE token = ?"
+
 async def get_verification(token: str) -> Optional[Tuple]:
     """
     Return a single verification row for token:
-      (id, discord_id, token, status, used, created_at, expires_at)
+      (id, discord_id, token, status, used, created_at, expires_at, sig)
     Returns None if not found.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT id, discord_id, token, status, used, created_at, expires_at FROM verifications WHERE token = ?",
-            (token,)
-        )
+    async with _pool().connection() as db:
+        cur = await db.execute(_GET_VERIFICATION_SQL, (token,))
         r = await cur.fetchone()
         return r
 
+_GET_STATUS_SQL = (
+    "SELECT v.discord_id, v.status, v.used, "
+    " (SELECT action FROM actions WHERE discord_id = v.discord_id ORDER BY created_at DESC LIMIT 1), "
+    " (SELECT reason FROM actions WHERE discord_id = v.discord_id ORDER BY created_at DESC LIMIT 1), "
+    " (SELECT until_ts FROM quarantined WHERE discord_id = v.discord_id ORDER BY created_at DESC LIMIT 1) "
+    "FROM verifications v WHERE v.token = ?"
+)
+
+async def get_status(token: str) -> Optional[Dict]:
+    """
+    One-round-trip status view for the verify page: verification state plus
+    the member's latest action/reason and quarantine expiry. Each subquery
+    is an index seek on (discord_id, created_at DESC).
+    """
+    async with _pool().connection() as db:
+        cur = await db.execute(_GET_STATUS_SQL, (token,))
+        r = await cur.fetchone()
+    if not r:
+        return None
+    return {
+        'discord_id': str(r[0]),
+        'status': r[1] or 'pending',
+        'used': bool(r[2]),
+        'action': r[3],
+        'reason': r[4],
+        'quarantined_until': r[5],
+    }
+
 async def mark_token_used(token: str):
     """
     Mark token as used and set verified_at timestamp.
     """
     ts = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool().connection() as db:
         await db.execute(
             "UPDATE verifications SET used = 1, verified_at = ? WHERE token = ?",
             (ts, token)
@@ -89,7 +248,7 @@ async def set_verification_status(token: str, status: str):
     Update the status field (e.g., 'verified', 'quarantined', 'failed') and set verified_at.
     """
     ts = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool().connection() as db:
         await db.execute(
             "UPDATE verifications SET status = ?, verified_at = ? WHERE token = ?",
             (status, ts, token)
@@ -99,25 +258,95 @@ async def set_verification_status(token: str, status: str):
 # -----------------------
 # Fingerprints & DNA
 # -----------------------
-async def save_fingerprint(token: str, fp: str, ip: str, asn: Optional[str], ua: Optional[str], honeypot: int = 0):
+def fp_hash(fp_obj) -> bytes:
+    """
+    16-byte BLAKE2s digest of the canonicalized fp value.
+    Accepts the raw JSON string sent by the client or an already-parsed
+    object; keys are sorted before hashing so equal fingerprints always
+    hash equal regardless of serialization order.
+    """
+    if isinstance(fp_obj, (bytes, str)):
+        try:
+            fp_obj = orjson.loads(fp_obj)
+        except Exception:
+            pass
+    if isinstance(fp_obj, bytes):
+        data = fp_obj
+    elif isinstance(fp_obj, str):
+        data = fp_obj.encode()
+    else:
+        data = orjson.dumps(fp_obj, option=orjson.OPT_SORT_KEYS)
+    return hashlib.blake2s(data, digest_size=16).digest()
+
+def _fp_inner(fp):
+    """Pull the inner fp object out of a stored payload string."""
+    try:
+        payload = orjson.loads(fp) if fp else {}
+        return payload.get('fp', payload) if isinstance(payload, dict) else payload
+    except Exception:
+        return fp
+
+def _fingerprint_row(token, fp, ip, asn, ua, honeypot, ts) -> Tuple:
+    return (token, fp, fp_hash(_fp_inner(fp)), ip or "", asn or "", ua or "", int(bool(honeypot)), ts)
+
+_FINGERPRINT_INSERT = "INSERT INTO fingerprints (token, fp, fp_hash, ip, asn, ua, honeypot, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+async def save_fingerprint(token: str, fp: str, ip: str, asn: Optional[str], ua: Optional[str], honeypot: int = 0, ts: Optional[int] = None):
     """
     Save a fingerprint row. 'fp' is typically a JSON string containing device/fp data.
     honeypot: 0 or 1
+    The canonical hash of the inner fp object is stored alongside so
+    duplicate-device lookups compare fixed-width keys, not JSON text.
+    ts: optional caller-captured timestamp so one request doesn't fetch
+    the clock once per helper.
     """
-    ts = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO fingerprints (token, fp, ip, asn, ua, honeypot, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (token, fp, ip or "", asn or "", ua or "", int(bool(honeypot)), ts)
+    ts = int(ts) if ts is not None else int(time.time())
+    async with _pool().connection() as db:
+        await db.execute(_FINGERPRINT_INSERT, _fingerprint_row(token, fp, ip, asn, ua, honeypot, ts))
+        await db.commit()
+
+async def save_fingerprints_many(rows: List[Tuple]):
+    """
+    Batched variant of save_fingerprint: rows are
+    (token, fp, ip, asn, ua, honeypot, ts) tuples, written in a single
+    transaction so the whole batch costs one commit/fsync.
+    """
+    if not rows:
+        return
+    prepared = [_fingerprint_row(*row) for row in rows]
+    async with _pool().connection() as db:
+        await db.executemany(_FINGERPRINT_INSERT, prepared)
+        await db.commit()
+
+async def submit_fingerprint_if_valid(token: str, fp: str, ip: str, asn: Optional[str], ua: Optional[str], honeypot: int = 0, ts: Optional[int] = None) -> Optional[int]:
+    """
+    Atomically validate the token and insert the fingerprint in one
+    statement: the INSERT only fires if the token exists, is unused and
+    unexpired (same rules the web layer checks). Returns the inserted row
+    id, or None if the token was invalid — no separate SELECT round-trip
+    and no check-then-write race. Requires SQLite >= 3.35 for RETURNING.
+    """
+    ts = int(ts) if ts is not None else int(time.time())
+    row = _fingerprint_row(token, fp, ip, asn, ua, honeypot, ts)
+    async with _pool().connection() as db:
+        cur = await db.execute(
+            "INSERT INTO fingerprints (token, fp, fp_hash, ip, asn, ua, honeypot, created_at) "
+            "SELECT ?, ?, ?, ?, ?, ?, ?, ? "
+            "WHERE EXISTS (SELECT 1 FROM verifications WHERE token = ? AND used = 0 "
+            "              AND (expires_at IS NULL OR expires_at > ?)) "
+            "RETURNING id",
+            (*row, token, ts)
         )
+        r = await cur.fetchone()
         await db.commit()
+        return int(r[0]) if r else None
 
 async def fetch_fingerprints_by_token(token: str) -> List[Tuple]:
     """
     Return fingerprint rows for a given token, ordered newest-first.
     Each row is: (id, token, fp, ip, asn, ua, honeypot, created_at)
     """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool().connection() as db:
         cur = await db.execute(
             "SELECT id, token, fp, ip, asn, ua, honeypot, created_at FROM fingerprints WHERE token = ? ORDER BY created_at DESC",
             (token,)
@@ -125,20 +354,100 @@ async def fetch_fingerprints_by_token(token: str) -> List[Tuple]:
         rows = await cur.fetchall()
         return rows
 
+async def fetch_fingerprint_summary(token: str) -> Tuple[Optional[Tuple], int]:
+    """
+    Return (newest_row, honeypot_any) for a token in one round-trip.
+    newest_row has the same column order as fetch_fingerprints_by_token;
+    honeypot_any aggregates MAX(honeypot) over every row for the token so
+    callers don't have to materialize the full list just to test the flag.
+    """
+    async with _pool().connection() as db:
+        cur = await db.execute(
+            "SELECT id, token, fp, ip, asn, ua, honeypot, created_at, MAX(honeypot) OVER () "
+            "FROM fingerprints WHERE token = ? ORDER BY created_at DESC LIMIT 1",
+            (token,)
+        )
+        r = await cur.fetchone()
+        if not r:
+            return None, 0
+        return tuple(r[:8]), int(r[8] or 0)
+
+async def compute_db_stats(ip: str, fph: bytes, fp: str, token: str) -> Dict:
+    """
+    Duplicate/ban counters for the risk engine in one round-trip:
+    distinct other tokens sharing the IP or fingerprint hash, plus exact
+    ip/fp matches among recorded bans. Each subselect is an index probe.
+    """
+    async with _pool().connection() as db:
+        cur = await db.execute(
+            "SELECT "
+            " (SELECT COUNT(DISTINCT token) FROM fingerprints WHERE ip = :ip AND token != :tok), "
+            " (SELECT COUNT(DISTINCT token) FROM fingerprints WHERE fp_hash = :fph AND token != :tok), "
+            " (SELECT COUNT(*) FROM actions WHERE action = 'ban' AND (ip = :ip OR fp = :fp))",
+            {'ip': ip, 'fph': fph, 'fp': fp, 'tok': token}
+        )
+        r = await cur.fetchone()
+    return {
+        'same_ip_count': int(r[0] or 0) if r else 0,
+        'same_fp_count': int(r[1] or 0) if r else 0,
+        'previously_banned_count': int(r[2] or 0) if r else 0,
+    }
+
+async def load_fp_rows(token: str) -> Tuple[List[Dict], int]:
+    """
+    Boundary loader for the risk engine: returns ([newest_row], honeypot_any)
+    with the fp payload already parsed, so downstream scoring never touches
+    raw JSON. Row keys: fp, ip, asn, ua, honeypot, dna, ip_info.
+    """
+    raw, honeypot_any = await fetch_fingerprint_summary(token)
+    if not raw:
+        return [], honeypot_any
+    fp_json = raw[2]
+    try:
+        parsed = orjson.loads(fp_json) if fp_json else {}
+    except Exception:
+        parsed = {}
+    dna = parsed.get('dna', {}) if isinstance(parsed, dict) else {}
+    ip_info = parsed.get('ip_info', {}) if isinstance(parsed, dict) else {}
+    row = {
+        'fp': (parsed.get('fp') if isinstance(parsed, dict) else None) or parsed,
+        'ip': raw[3],
+        'asn': raw[4] or (ip_info.get('asn') if isinstance(ip_info, dict) else None),
+        'ua': raw[5],
+        'honeypot': bool(raw[6]),
+        'dna': dna,
+        'ip_info': ip_info,
+    }
+    return [row], honeypot_any
+
 # -----------------------
 # DNA profiles (typing/mouse)
 # -----------------------
+def _norm_vec(values) -> bytes:
+    """L2-normalized float32 vector as raw bytes; b'' if not numeric."""
+    try:
+        v = np.asarray(values if values else [], dtype=np.float32)
+    except Exception:
+        return b''
+    n = float(np.linalg.norm(v))
+    if n:
+        v = v / n
+    return v.tobytes()
+
 async def save_dna_profile(discord_id: str, typing_profile, mouse_profile):
     """
-    Stores DNA profiles (JSON serialised). typing_profile and mouse_profile should be JSON-serializable.
+    Stores DNA profiles (JSON serialised), plus pre-normalized float32
+    vectors so the risk engine loads them with zero parsing — the norm
+    never changes after insert, so it's paid once here instead of on
+    every read.
     """
     ts = int(time.time())
-    typing_json = json.dumps(typing_profile)
-    mouse_json = json.dumps(mouse_profile)
-    async with aiosqlite.connect(DB_PATH) as db:
+    typing_json = orjson.dumps(typing_profile)
+    mouse_json = orjson.dumps(mouse_profile)
+    async with _pool().connection() as db:
         await db.execute(
-            "INSERT INTO dna_profiles (discord_id, typing_profile, mouse_profile, created_at) VALUES (?, ?, ?, ?)",
-            (discord_id, typing_json, mouse_json, ts)
+            "INSERT INTO dna_profiles (discord_id, typing_profile, mouse_profile, typing_vec, mouse_vec, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (discord_id, typing_json, mouse_json, _norm_vec(typing_profile), _norm_vec(mouse_profile), ts)
         )
         await db.commit()
 
@@ -146,35 +455,76 @@ async def fetch_all_dna_profiles() -> List[Dict]:
     """
     Return a list of DNA profile dicts: {'discord_id': str, 'typing': [...], 'mouse': [...]}
     """
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT discord_id, typing_profile, mouse_profile FROM dna_profiles")
+    async with _pool().connection() as db:
+        cur = await db.execute("SELECT discord_id, typing_profile, mouse_profile, typing_vec, mouse_vec FROM dna_profiles")
         rows = await cur.fetchall()
-        out = []
-        for r in rows:
-            discord_id = r[0]
-            try:
-                typing = json.loads(r[1]) if r[1] else []
-            except Exception:
-                typing = []
-            try:
-                mouse = json.loads(r[2]) if r[2] else []
-            except Exception:
-                mouse = []
-            out.append({'discord_id': discord_id, 'typing': typing, 'mouse': mouse})
-        return out
+        try:
+            # vec columns are pre-normalized float32 and load with a single
+            # frombuffer; JSON is only parsed for legacy rows without them
+            return [
+                {
+                    'discord_id': r[0],
+                    'typing': np.frombuffer(r[3], dtype=np.float32) if r[3] else (orjson.loads(r[1]) if r[1] else []),
+                    'mouse': np.frombuffer(r[4], dtype=np.float32) if r[4] else (orjson.loads(r[2]) if r[2] else []),
+                }
+                for r in rows
+            ]
+        except Exception:
+            # a corrupt profile poisons the comprehension; fall back to
+            # row-by-row with per-field recovery
+            out = []
+            for r in rows:
+                try:
+                    typing = orjson.loads(r[1]) if r[1] else []
+                except Exception:
+                    typing = []
+                try:
+                    mouse = orjson.loads(r[2]) if r[2] else []
+                except Exception:
+                    mouse = []
+                out.append({'discord_id': r[0], 'typing': typing, 'mouse': mouse})
+            return out
+
+async def dna_profile_exists(discord_id: str) -> bool:
+    """
+    True if a DNA profile is already stored for discord_id.
+    Single index probe; avoids fetching every profile just to test membership.
+    """
+    async with _pool().connection() as db:
+        cur = await db.execute(
+            "SELECT 1 FROM dna_profiles WHERE discord_id = ? LIMIT 1",
+            (discord_id,)
+        )
+        return await cur.fetchone() is not None
 
 # -----------------------
 # Actions & quarantine
 # -----------------------
-async def add_action(discord_id: str, action: str, reason: str):
+async def add_action(discord_id: str, action: str, reason: str, ip: Optional[str] = None, fp: Optional[str] = None, ts: Optional[int] = None):
     """
     Log an action (verify/quarantine/ban/etc.) for auditing.
+    ip/fp are optional exact-match columns so ban history can be queried
+    without LIKE scans over the reason text.
     """
-    ts = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
+    ts = int(ts) if ts is not None else int(time.time())
+    async with _pool().connection() as db:
         await db.execute(
-            "INSERT INTO actions (discord_id, action, reason, created_at) VALUES (?, ?, ?, ?)",
-            (discord_id, action, reason or '', ts)
+            "INSERT INTO actions (discord_id, action, reason, ip, fp, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (discord_id, action, reason or '', ip, fp, ts)
+        )
+        await db.commit()
+
+async def add_actions_many(rows: List[Tuple]):
+    """
+    Batched variant of add_action: rows are
+    (discord_id, action, reason, ip, fp, ts) tuples in one transaction.
+    """
+    if not rows:
+        return
+    async with _pool().connection() as db:
+        await db.executemany(
+            "INSERT INTO actions (discord_id, action, reason, ip, fp, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
         )
         await db.commit()
 
@@ -183,22 +533,56 @@ async def quarantine_member(discord_id: str, until_ts: int):
     Insert a quarantine row (time-bomb).
     """
     ts = int(time.time())
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool().connection() as db:
         await db.execute(
             "INSERT INTO quarantined (discord_id, until_ts, created_at) VALUES (?, ?, ?)",
             (discord_id, int(until_ts), ts)
         )
         await db.commit()
 
+async def remove_quarantine(discord_id: str):
+    """
+    Drop a member's quarantine rows once served, so restarts don't
+    re-process long-expired entries.
+    """
+    async with _pool().connection() as db:
+        await db.execute("DELETE FROM quarantined WHERE discord_id = ?", (discord_id,))
+        await db.commit()
+
 async def get_quarantined() -> List[Tuple]:
     """
     Return list of (discord_id, until_ts) for quarantined entries.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool().connection() as db:
         cur = await db.execute("SELECT discord_id, until_ts FROM quarantined")
         rows = await cur.fetchall()
         return rows
 
+async def get_expired_quarantined(now_ts: int) -> List[Tuple]:
+    """
+    Return (discord_id, until_ts) rows whose quarantine has already elapsed.
+    Index range scan on until_ts — only expired rows cross the wire.
+    """
+    async with _pool().connection() as db:
+        cur = await db.execute(
+            "SELECT discord_id, until_ts FROM quarantined WHERE until_ts <= ?",
+            (int(now_ts),)
+        )
+        rows = await cur.fetchall()
+        return rows
+
+async def get_active_quarantined(now_ts: int) -> List[Tuple]:
+    """
+    Return (discord_id, until_ts) rows still serving quarantine.
+    """
+    async with _pool().connection() as db:
+        cur = await db.execute(
+            "SELECT discord_id, until_ts FROM quarantined WHERE until_ts > ?",
+            (int(now_ts),)
+        )
+        rows = await cur.fetchall()
+        return rows
+
 # -----------------------
 # Convenience / maintenance helpers (optional)
 # -----------------------
@@ -206,7 +590,7 @@ async def fetch_latest_action_for(discord_id: str) -> Optional[Tuple]:
     """
     Returns the latest (action, reason, created_at) for a discord_id, or None.
     """
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _pool().connection() as db:
         cur = await db.execute(
             "SELECT action, reason, created_at FROM actions WHERE discord_id = ? ORDER BY created_at DESC LIMIT 1",
             (discord_id,)
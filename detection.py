@@ -8,21 +8,148 @@ results from IP intelligence (is_vpn, is_tor, proxy_score, asn, is_datacenter).
 from typing import List, Dict
 import numpy as np
 
-def cosine(a, b):
-    a = np.array(a, dtype=float)
-    b = np.array(b, dtype=float)
+def cosine(a, b, na: float = None, nb: float = None):
+    """
+    Cosine similarity. asarray keeps existing ndarrays as-is (no copy);
+    pass precomputed norms to skip the sqrt per call — with pre-normalized
+    vectors (na=nb=1.0) this reduces to a single dot product.
+    """
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
     if a.size == 0 or b.size == 0:
         return 0.0
-    denom = (np.linalg.norm(a) * np.linalg.norm(b))
+    if na is None:
+        na = float(np.linalg.norm(a))
+    if nb is None:
+        nb = float(np.linalg.norm(b))
+    denom = na * nb
     if denom == 0:
         return 0.0
-    return float(np.dot(a, b) / denom)
+    return float(a @ b) / denom
 
 def dna_similarity(profile_a: Dict, profile_b: Dict) -> float:
     t_sim = cosine(profile_a.get('typing', []), profile_b.get('typing', []))
     m_sim = cosine(profile_a.get('mouse', []), profile_b.get('mouse', []))
     return 0.6 * t_sim + 0.4 * m_sim
 
+# fixed vector widths matching what the verify page collects
+TYPING_DIM = 40
+MOUSE_DIM = 200
+
+def _to_vec(values, dim: int) -> np.ndarray:
+    """Fixed-width float32 vector: truncated/zero-padded and L2-normalized."""
+    v = np.zeros(dim, dtype=np.float32)
+    if values is not None and len(values):
+        try:
+            arr = np.asarray(values[:dim], dtype=np.float32)
+        except Exception:
+            return v
+        v[:arr.size] = arr
+    n = float(np.linalg.norm(v))
+    if n:
+        v /= n
+    return v
+
+class KnownDnaIndex:
+    """
+    Matrix view over the known DNA profiles.
+
+    Rows are pre-normalized typing/mouse vectors, so scoring a query against
+    every profile is two matrix-vector products (one BLAS call each) instead
+    of a Python loop of per-profile cosines. float32 halves memory bandwidth
+    versus the default float64.
+    """
+    def __init__(self, profiles: List[Dict]):
+        self.ids = [p.get('discord_id') for p in profiles]
+        if profiles:
+            self.T = np.stack([_to_vec(p.get('typing', []), TYPING_DIM) for p in profiles])
+            self.M = np.stack([_to_vec(p.get('mouse', []), MOUSE_DIM) for p in profiles])
+        else:
+            self.T = np.zeros((0, TYPING_DIM), dtype=np.float32)
+            self.M = np.zeros((0, MOUSE_DIM), dtype=np.float32)
+
+    def similarities(self, profile: Dict) -> np.ndarray:
+        t_q = _to_vec(profile.get('typing', []), TYPING_DIM)
+        m_q = _to_vec(profile.get('mouse', []), MOUSE_DIM)
+        return 0.6 * (self.T @ t_q) + 0.4 * (self.M @ m_q)
+
+# lazily rebuilt matrix index; dna_profiles is append-only so
+# (row count, newest id) is a sufficient change fingerprint
+_dna_index = None
+_dna_index_key = None
+
+def _get_dna_index(profiles: List[Dict]) -> KnownDnaIndex:
+    global _dna_index, _dna_index_key
+    key = (len(profiles), profiles[-1].get('discord_id') if profiles else None)
+    if _dna_index is None or key != _dna_index_key:
+        _dna_index = KnownDnaIndex(profiles)
+        _dna_index_key = key
+    return _dna_index
+
+# Premium weights (tuneable)
+W_DUP_FP = 25.0
+W_DUP_IP = 20.0
+W_ASN_DATACENTER = 25.0
+W_VPN = 35.0
+W_TOR = 40.0
+W_PROXY_SCORE_FACTOR = 0.5  # multiply proxy_score (0-100) by this
+W_HONEYPOT = 90.0
+W_ACCOUNT_AGE = 20.0
+W_DNA_MATCH = 35.0
+W_PREVIOUS_BANS = 25.0
+W_SOCIAL_ISOLATION = 8.0
+
+# kernel slot ids; the reason formatter maps these back to text
+_K_DUP_FP, _K_DUP_IP, _K_PREV_BANS, _K_DATACENTER, _K_VPN, _K_TOR, \
+    _K_PROXY, _K_HONEYPOT, _K_AGE1, _K_AGE7 = range(10)
+
+def _score_core(same_fp, same_ip, prev_bans, is_datacenter, is_vpn, is_tor,
+                proxy_score, honeypot, account_age_days):
+    """
+    Scalar scoring kernel: plain arithmetic on unpacked flags, no dict
+    lookups or string formatting inside. Returns (score, hits) where hits
+    are (slot, add) pairs — reason strings are built afterwards, only for
+    contributions that actually fired.
+    """
+    score = 0.0
+    hits = []
+    if same_fp > 0:
+        add = W_DUP_FP * min(3, same_fp)
+        score += add
+        hits.append((_K_DUP_FP, add))
+    if same_ip > 0:
+        add = W_DUP_IP * (min(4, same_ip) / 2.0)
+        score += add
+        hits.append((_K_DUP_IP, add))
+    if prev_bans > 0:
+        add = min(W_PREVIOUS_BANS, prev_bans * 10)
+        score += add
+        hits.append((_K_PREV_BANS, add))
+    if is_datacenter:
+        score += W_ASN_DATACENTER
+        hits.append((_K_DATACENTER, W_ASN_DATACENTER))
+    if is_vpn:
+        score += W_VPN
+        hits.append((_K_VPN, W_VPN))
+    if is_tor:
+        score += W_TOR
+        hits.append((_K_TOR, W_TOR))
+    if proxy_score:
+        add = proxy_score * W_PROXY_SCORE_FACTOR
+        score += add
+        hits.append((_K_PROXY, add))
+    if honeypot:
+        score += W_HONEYPOT
+        hits.append((_K_HONEYPOT, W_HONEYPOT))
+    if account_age_days < 1:
+        score += W_ACCOUNT_AGE
+        hits.append((_K_AGE1, W_ACCOUNT_AGE))
+    elif account_age_days < 7:
+        add = W_ACCOUNT_AGE * 0.6
+        score += add
+        hits.append((_K_AGE7, add))
+    return score, hits
+
 def compute_risk(fp_rows: List[Dict],
                  known_dna_profiles: List[Dict],
                  ip_info: Dict,
@@ -36,85 +163,50 @@ def compute_risk(fp_rows: List[Dict],
       - same_fp_count: int
       - previously_banned_count: int
     """
-    score = 0.0
-    reasons = []
     dna_matches = []
 
-    # Premium weights (tuneable)
-    W_DUP_FP = 25.0
-    W_DUP_IP = 20.0
-    W_ASN_DATACENTER = 25.0
-    W_VPN = 35.0
-    W_TOR = 40.0
-    W_PROXY_SCORE_FACTOR = 0.5  # multiply proxy_score (0-100) by this
-    W_HONEYPOT = 90.0
-    W_ACCOUNT_AGE = 20.0
-    W_DNA_MATCH = 35.0
-    W_PREVIOUS_BANS = 25.0
-    W_SOCIAL_ISOLATION = 8.0
-
-    # duplicate fingerprint (strong signal)
-    if db_stats:
-        if db_stats.get('same_fp_count', 0) > 0:
-            delta = min(3, db_stats['same_fp_count'])  # scale
-            add = W_DUP_FP * delta
-            score += add
-            reasons.append(f'Duplicate fingerprint matches {db_stats["same_fp_count"]} (+{add:.0f})')
-
-        if db_stats.get('same_ip_count', 0) > 0:
-            delta = min(4, db_stats['same_ip_count'])
-            add = W_DUP_IP * (delta / 2.0)
-            score += add
-            reasons.append(f'Same IP seen across {db_stats["same_ip_count"]} accounts (+{add:.0f})')
-
-        if db_stats.get('previously_banned_count', 0) > 0:
-            add = min( W_PREVIOUS_BANS, db_stats['previously_banned_count'] * 10 )
-            score += add
-            reasons.append(f'Previously banned accounts on same device/IP (+{add:.0f})')
-
-    # ip_info flags
-    if ip_info:
-        if ip_info.get('is_datacenter'):
-            score += W_ASN_DATACENTER
-            reasons.append(f'Datacenter ASN detected (+{W_ASN_DATACENTER})')
-        if ip_info.get('is_vpn'):
-            score += W_VPN
-            reasons.append(f'VPN/proxy likely (+{W_VPN})')
-        if ip_info.get('is_tor'):
-            score += W_TOR
-            reasons.append(f'Tor exit node detected (+{W_TOR})')
-        proxy_score = ip_info.get('proxy_score')
-        if proxy_score:
-            add = proxy_score * W_PROXY_SCORE_FACTOR
-            score += add
-            reasons.append(f'Proxy score {proxy_score} (+{add:.1f})')
-
-    # honeypot is nearly certain
-    if honeypot_triggered:
-        score += W_HONEYPOT
-        reasons.append(f'Honeypot triggered (+{W_HONEYPOT})')
+    same_fp = db_stats.get('same_fp_count', 0) if db_stats else 0
+    same_ip = db_stats.get('same_ip_count', 0) if db_stats else 0
+    prev_bans = db_stats.get('previously_banned_count', 0) if db_stats else 0
+    proxy_score = ip_info.get('proxy_score') if ip_info else 0
 
-    # account age
-    if account_age_days < 1:
-        score += W_ACCOUNT_AGE
-        reasons.append(f'New account (<1d) (+{W_ACCOUNT_AGE})')
-    elif account_age_days < 7:
-        score += W_ACCOUNT_AGE * 0.6
-        reasons.append(f'New account (<7d) (+{W_ACCOUNT_AGE*0.6:.0f})')
+    score, hits = _score_core(
+        same_fp, same_ip, prev_bans,
+        bool(ip_info and ip_info.get('is_datacenter')),
+        bool(ip_info and ip_info.get('is_vpn')),
+        bool(ip_info and ip_info.get('is_tor')),
+        proxy_score or 0,
+        honeypot_triggered,
+        account_age_days,
+    )
+
+    # reason text only for the slots that fired
+    _reason_for = {
+        _K_DUP_FP: lambda add: f'Duplicate fingerprint matches {same_fp} (+{add:.0f})',
+        _K_DUP_IP: lambda add: f'Same IP seen across {same_ip} accounts (+{add:.0f})',
+        _K_PREV_BANS: lambda add: f'Previously banned accounts on same device/IP (+{add:.0f})',
+        _K_DATACENTER: lambda add: f'Datacenter ASN detected (+{add})',
+        _K_VPN: lambda add: f'VPN/proxy likely (+{add})',
+        _K_TOR: lambda add: f'Tor exit node detected (+{add})',
+        _K_PROXY: lambda add: f'Proxy score {proxy_score} (+{add:.1f})',
+        _K_HONEYPOT: lambda add: f'Honeypot triggered (+{add})',
+        _K_AGE1: lambda add: f'New account (<1d) (+{add})',
+        _K_AGE7: lambda add: f'New account (<7d) (+{add:.0f})',
+    }
+    reasons = [_reason_for[slot](add) for slot, add in hits]
 
     # DNA comparisons
     current_profile = None
     if fp_rows:
         current_profile = fp_rows[0].get('dna')
     if current_profile and known_dna_profiles:
-        for prof in known_dna_profiles:
-            # prof: {'discord_id','typing','mouse'}
-            other_profile = {'typing': prof.get('typing', []), 'mouse': prof.get('mouse', [])}
-            sim = dna_similarity(current_profile, other_profile)
-            if sim > 0.78:
-                dna_matches.append({'discord_id': prof.get('discord_id'), 'sim': round(sim, 3)})
-                score += W_DNA_MATCH
-                reasons.append(f'DNA match to {prof.get("discord_id")} sim={sim:.2f} (+{W_DNA_MATCH})')
+        idx = _get_dna_index(known_dna_profiles)
+        sims = idx.similarities(current_profile)
+        for i in np.nonzero(sims > 0.78)[0]:
+            sim = float(sims[i])
+            dna_matches.append({'discord_id': idx.ids[i], 'sim': round(sim, 3)})
+            score += W_DNA_MATCH
+            reasons.append(f'DNA match to {idx.ids[i]} sim={sim:.2f} (+{W_DNA_MATCH})')
 
     # social isolation
     if social_scores:
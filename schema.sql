@@ -5,7 +5,10 @@ CREATE TABLE IF NOT EXISTS verifications (
   discord_id TEXT,
   token TEXT UNIQUE,
   status TEXT,
+  used INTEGER DEFAULT 0,
+  sig TEXT,
   created_at INTEGER,
+  expires_at INTEGER,
   verified_at INTEGER
 );
 
@@ -13,6 +16,7 @@ CREATE TABLE IF NOT EXISTS fingerprints (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   token TEXT,
   fp TEXT,
+  fp_hash BLOB,
   ip TEXT,
   asn TEXT,
   ua TEXT,
@@ -25,6 +29,8 @@ CREATE TABLE IF NOT EXISTS dna_profiles (
   discord_id TEXT,
   typing_profile BLOB,
   mouse_profile BLOB,
+  typing_vec BLOB,
+  mouse_vec BLOB,
   created_at INTEGER
 );
 
@@ -33,6 +39,8 @@ CREATE TABLE IF NOT EXISTS actions (
   discord_id TEXT,
   action TEXT,
   reason TEXT,
+  ip TEXT,
+  fp TEXT,
   created_at INTEGER
 );
 
@@ -56,3 +64,15 @@ CREATE TABLE IF NOT EXISTS social_links (
   weight INTEGER DEFAULT 1,
   created_at INTEGER
 );
+
+-- covering indexes for the verification hot path: duplicate-token counters
+-- and previous-ban lookups become index probes instead of table scans
+CREATE INDEX IF NOT EXISTS idx_fp_ip ON fingerprints(ip, token);
+CREATE INDEX IF NOT EXISTS idx_fp_fp ON fingerprints(fp, token);
+CREATE INDEX IF NOT EXISTS idx_fp_hash ON fingerprints(fp_hash, token);
+CREATE INDEX IF NOT EXISTS idx_actions_action ON actions(action);
+CREATE INDEX IF NOT EXISTS idx_dna_discord ON dna_profiles(discord_id);
+CREATE INDEX IF NOT EXISTS idx_quarantined_until ON quarantined(until_ts);
+CREATE INDEX IF NOT EXISTS idx_verifications_expires ON verifications(expires_at, used);
+CREATE INDEX IF NOT EXISTS idx_actions_did_ts ON actions(discord_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_quarantined_did_ts ON quarantined(discord_id, created_at DESC);
@@ -2,18 +2,59 @@
 """
 AegisX-S Verification Web Server
 DoubleCounter-style clone: saves fingerprints, posts to bot with HMAC.
+Runs on Quart so handlers are native coroutines sharing one event loop —
+DB and HTTP awaits overlap instead of being forced through a sync bridge.
 """
 
-import asyncio, os, time, json, hmac, hashlib, csv
+import asyncio, ipaddress, logging, logging.handlers, os, queue, re, time, hmac, hashlib, csv
+import orjson
+
+try:
+    # libuv-backed event loop; roughly doubles socket dispatch throughput.
+    # No-op on Windows where uvloop isn't available.
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
 from io import StringIO
-from collections import defaultdict, deque
-import aiohttp, aiosqlite
-from flask import Flask, request, render_template, jsonify
+from collections import OrderedDict
+from cachetools import TTLCache
+import aiohttp
+from markupsafe import escape
+from quart import Quart, request, jsonify
+from quart.json.provider import DefaultJSONProvider
+
+from db import init_db, get_verification, get_status, submit_fingerprint_if_valid, pooled_connection, close_pool
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Route jsonify/get_json through orjson's C encoder."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app = Quart(__name__)
+app.json = ORJSONProvider(app)
+# fingerprint payloads are a few KB; anything bigger is abuse — reject it
+# before JSON parsing burns CPU on it
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024
 
-from db import init_db, save_fingerprint, get_verification
+# log records go through a queue; formatting and the stdout write() happen
+# on the listener thread, not inside request coroutines holding the loop
+log = logging.getLogger('aegisx.web')
 
-app = Flask(__name__)
-asyncio.get_event_loop().run_until_complete(init_db())
+def _setup_logging():
+    q = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(q, logging.StreamHandler())
+    listener.start()
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(q))
+    if root.level > logging.INFO:
+        root.setLevel(logging.INFO)
+    return listener
+
+_log_listener = _setup_logging()
 
 # ----------------------
 # Config
@@ -22,33 +63,144 @@ BOT_INTERNAL_VERIFY = os.getenv("BOT_INTERNAL_VERIFY", "http://127.0.0.1:5001/ve
 VERIFY_SECRET = os.getenv("VERIFY_SECRET", "please_set_verify_secret")
 ADMIN_SECRET = os.getenv("ADMIN_SECRET", "please_set_admin_secret")
 
+# pre-encoded key + one-shot hmac.digest: dispatches straight to OpenSSL's
+# optimized path (SHA-NI where available) with no per-call HMAC object
+VERIFY_SECRET_BYTES = VERIFY_SECRET.encode()
+
 RATE_WINDOW = int(os.getenv("RATE_WINDOW_SECONDS", "10"))
 RATE_LIMIT = int(os.getenv("RATE_LIMIT_PER_WINDOW", "3"))
-_ip_store = defaultdict(lambda: deque(maxlen=200))
+# token bucket per IP: two floats and O(1) refill arithmetic, with natural
+# burst handling — refill rate is RATE_LIMIT tokens per RATE_WINDOW.
+# Kept in an LRU-ordered map capped at MAX_TRACKED_IPS so RSS stays flat no
+# matter how many distinct IPs an attacker cycles through.
+_ip_store: OrderedDict = OrderedDict()
+MAX_TRACKED_IPS = 100_000
+
+def _rate_limit_exceeded(ip: str) -> bool:
+    now = time.time()
+    bucket = _ip_store.get(ip)
+    if bucket is not None:
+        _ip_store.move_to_end(ip)
+        tokens, last = bucket
+        tokens = min(RATE_LIMIT, tokens + (now - last) * RATE_LIMIT / RATE_WINDOW)
+    else:
+        tokens = RATE_LIMIT
+    exceeded = tokens < 1
+    _ip_store[ip] = [tokens if exceeded else tokens - 1, now]
+    while len(_ip_store) > MAX_TRACKED_IPS:
+        _ip_store.popitem(last=False)
+    return exceeded
+
+# ----------------------
+# Shared HTTP session
+# ----------------------
+# one pooled session for all outbound calls; a fresh ClientSession per
+# request pays DNS + TCP (+TLS) setup every time
+HTTP_SESSION = None
+
+# one prebuilt timeout with separate budgets: a hung connect is cut off in
+# 1s instead of eating the whole 6s budget before the read even starts
+BOT_TIMEOUT = aiohttp.ClientTimeout(total=6, connect=1, sock_read=5)
+
+def _http_session():
+    global HTTP_SESSION
+    if HTTP_SESSION is None:
+        HTTP_SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=30),
+            timeout=aiohttp.ClientTimeout(total=6)
+        )
+    return HTTP_SESSION
+
+# ----------------------
+# Submit pipeline queue
+# ----------------------
+# everything after token validation (ip-intel, fingerprint write, bot
+# notify) runs off-request in a bounded worker pool; /submit returns as
+# soon as the job is queued and the browser polls /status for the result
+SUBMIT_WORKERS = 4
+SUBMIT_QUEUE = asyncio.Queue(maxsize=10_000)
+
+async def submit_worker():
+    while True:
+        job = await SUBMIT_QUEUE.get()
+        try:
+            await handle_submit(*job)
+        except Exception:
+            log.exception("submit_worker failed")
+        finally:
+            SUBMIT_QUEUE.task_done()
+
+@app.before_serving
+async def _startup():
+    await init_db()
+    # warm the session on the serving loop so the first submit doesn't pay
+    # construction cost
+    _http_session()
+    app.submit_workers = [asyncio.create_task(submit_worker()) for _ in range(SUBMIT_WORKERS)]
+
+@app.after_serving
+async def _shutdown():
+    if HTTP_SESSION is not None:
+        await HTTP_SESSION.close()
+    await close_pool()
 
 # ----------------------
 # IP Intelligence (demo-level)
 # ----------------------
 DATACENTER_KEYWORDS = ["aws", "amazon", "google", "gcp", "ovh", "digitalocean", "linode", "hetzner", "azure", "microsoft"]
+# one C-level scan instead of a Python loop of substring searches per call
+DATACENTER_RE = re.compile("|".join(map(re.escape, DATACENTER_KEYWORDS)), re.I)
+
+# results barely change within minutes, and abuse bursts/retries share an
+# IP — serve repeats from cache so a real provider lookup is paid once
+_ip_info_cache = TTLCache(maxsize=10_000, ttl=600)
+
+_LOCAL_IP_INFO = {"is_datacenter": False, "is_vpn": False, "is_tor": False, "proxy_score": 0, "asn": "LOCAL"}
 
 async def lookup_ip_info(ip: str):
+    hit = _ip_info_cache.get(ip)
+    if hit is not None:
+        return hit
+    # private/loopback/link-local addresses can never resolve to anything
+    # useful — skip any provider work (and its quota/timeout) outright
+    try:
+        addr = ipaddress.ip_address(ip)
+        if addr.is_private or addr.is_loopback or addr.is_link_local or addr.is_reserved:
+            return _LOCAL_IP_INFO
+    except ValueError:
+        pass
     # simple heuristics only
-    return {
-        "is_datacenter": any(k in ip.lower() for k in DATACENTER_KEYWORDS),
+    res = {
+        "is_datacenter": DATACENTER_RE.search(ip) is not None,
         "is_vpn": False,
         "is_tor": False,
         "proxy_score": 0,
         "asn": "AS-LOCAL"
     }
+    _ip_info_cache[ip] = res
+    return res
 
 # ----------------------
 # Token validation
 # ----------------------
+# /start validates a token and /submit re-validates the same one moments
+# later; serve the second check from a short-lived cache. /status always
+# reads the DB so result polling stays fresh.
+_token_cache = TTLCache(maxsize=10_000, ttl=30)
+
+async def _get_verification_cached(token):
+    v = _token_cache.get(token)
+    if v is None:
+        v = await get_verification(token)
+        if v is not None:
+            _token_cache[token] = v
+    return v
+
 async def check_token_valid(token):
-    v = await get_verification(token)
+    v = await _get_verification_cached(token)
     if not v:
         return False, "token not found"
-    _, discord_id, _, status, used, created_at, expires_at = v
+    _, discord_id, _, status, used, created_at, expires_at, _sig = v
     now = int(time.time())
     if used:
         return False, "token already used"
@@ -59,30 +211,39 @@ async def check_token_valid(token):
 # ----------------------
 # Routes
 # ----------------------
+# the landing page only varies by token: load the template once and swap a
+# placeholder per request instead of running Jinja each time. The token is
+# escaped by hand since this bypasses autoescape.
+_VERIFY_HTML = None
+
+def _verify_page(token: str) -> bytes:
+    global _VERIFY_HTML
+    if _VERIFY_HTML is None:
+        with open(os.path.join(app.root_path, 'templates', 'verify.html'), 'rb') as f:
+            _VERIFY_HTML = f.read().replace(b'{{ token }}', b'{TOKEN}')
+    return _VERIFY_HTML.replace(b'{TOKEN}', str(escape(token)).encode())
+
 @app.route("/start/<token>")
-def start(token):
-    valid, reason = asyncio.get_event_loop().run_until_complete(check_token_valid(token))
+async def start(token):
+    valid, reason = await check_token_valid(token)
     if not valid:
         return f"<h2>Invalid or expired verification link</h2><p>{reason}</p>", 400
-    return render_template("verify.html", token=token)
+    return app.response_class(_verify_page(token), mimetype="text/html")
 
 @app.route("/submit", methods=["POST"])
-def submit():
-    data = request.json or {}
+async def submit():
+    if request.content_length and request.content_length > 16384:
+        return jsonify({"ok": False, "error": "payload too large"}), 413
+    data = await request.get_json(silent=True) or {}
     token = data.get("token")
     if not token:
         return jsonify({"ok": False, "error": "no token"}), 400
 
     ip = request.headers.get("X-Real-IP") or request.remote_addr
-    now = time.time()
-    dq = _ip_store[ip]
-    while dq and dq[0] < now - RATE_WINDOW:
-        dq.popleft()
-    if len(dq) >= RATE_LIMIT:
+    if _rate_limit_exceeded(ip):
         return jsonify({"ok": False, "error": "rate limit exceeded"}), 429
-    dq.append(now)
 
-    valid, reason = asyncio.get_event_loop().run_until_complete(check_token_valid(token))
+    valid, reason = await check_token_valid(token)
     if not valid:
         return jsonify({"ok": False, "error": reason}), 400
 
@@ -91,66 +252,83 @@ def submit():
     dna = data.get("dna", {})
     honeypot = bool(data.get("honeypot", False))
 
-    ip_info = asyncio.get_event_loop().run_until_complete(lookup_ip_info(ip))
-    payload_fp = json.dumps({"fp": fp, "dna": dna, "ip_info": ip_info})
+    try:
+        SUBMIT_QUEUE.put_nowait((token, fp, dna, ip, ua, honeypot))
+    except asyncio.QueueFull:
+        return jsonify({"ok": False, "error": "busy"}), 503
+    return jsonify({"ok": True, "status": "queued"}), 200
 
-    asyncio.get_event_loop().run_until_complete(
-        save_fingerprint(token, payload_fp, ip, ip_info.get("asn"), ua, int(honeypot))
-    )
+async def handle_submit(token, fp, dna, ip, ua, honeypot):
+    """Off-request half of /submit: ip-intel, atomic write, bot notify."""
+    ts = int(time.time())  # captured once; threaded through the writes
+    ip_info = await lookup_ip_info(ip)
+    # orjson returns bytes directly; SQLite stores them as-is and the
+    # reader (orjson.loads) takes bytes without an extra decode
+    payload_fp = orjson.dumps({"fp": fp, "dna": dna, "ip_info": ip_info})
 
-    sig = hmac.new(VERIFY_SECRET.encode(), token.encode(), hashlib.sha256).hexdigest()
+    # validation + insert in one atomic statement — no separate SELECT and
+    # no window for the token to be spent between check and write
+    new_id = await submit_fingerprint_if_valid(token, payload_fp, ip, ip_info.get("asn"), ua, int(honeypot), ts=ts)
+    if new_id is None:
+        return
 
-    async def notify_bot():
-        try:
-            async with aiohttp.ClientSession() as s:
-                async with s.post(BOT_INTERNAL_VERIFY,
-                                  json={"token": token},
-                                  headers={"X-Signature": sig},
-                                  timeout=6) as r:
-                    print("Bot notify:", r.status, await r.text())
-        except Exception as e:
-            print("notify_bot failed:", e)
-
-    asyncio.get_event_loop().create_task(notify_bot())
-    return jsonify({"ok": True, "status": "submitted"}), 200
+    # the issuer signed the token when it was created; forward that instead
+    # of re-deriving HMACs per submit (compute only for legacy rows)
+    v = await _get_verification_cached(token)
+    sig = v[7] if v and v[7] else hmac.digest(VERIFY_SECRET_BYTES, token.encode(), 'sha256').hex()
+    await notify_bot(token, sig)
+
+async def notify_bot(token, sig):
+    try:
+        s = _http_session()
+        async with s.post(BOT_INTERNAL_VERIFY,
+                          json={"token": token},
+                          headers={"X-Signature": sig},
+                          timeout=BOT_TIMEOUT) as r:
+            # only read/format the body when debug logging is on
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Bot notify %s %s", r.status, await r.text())
+    except Exception as e:
+        log.warning("notify_bot failed: %s", e)
 
 @app.route("/status/<token>")
-def status(token):
-    async def fetch():
-        v = await get_verification(token)
-        if not v:
-            return None
-        _, discord_id, _, status_val, used, created_at, expires_at = v
-        return {
-            "discord_id": str(discord_id),
-            "status": status_val or "pending",
-            "used": bool(used)
-        }
-    res = asyncio.get_event_loop().run_until_complete(fetch())
+async def status(token):
+    # single round-trip including the latest action/reason the verify page
+    # polls for
+    res = await get_status(token)
     if not res:
         return jsonify({"ok": False, "error": "token not found"}), 404
     return jsonify({"ok": True, **res})
 
 @app.route("/admin/export")
-def admin_export():
+async def admin_export():
     secret = request.args.get("secret") or request.headers.get("X-Admin-Secret")
     if secret != ADMIN_SECRET:
         return "Forbidden", 403
 
-    async def fetch_all():
-        async with aiosqlite.connect("aegisx_s.db") as conn:
-            cur = await conn.execute("SELECT discord_id, token, status, used, created_at, expires_at FROM verifications ORDER BY created_at DESC")
-            return await cur.fetchall()
-    rows = asyncio.get_event_loop().run_until_complete(fetch_all())
-    si = StringIO()
-    cw = csv.writer(si)
-    cw.writerow(["discord_id", "token", "status", "used", "created_at", "expires_at"])
-    for r in rows:
-        cw.writerow(list(r))
-    return app.response_class(si.getvalue(), mimetype="text/csv")
+    async def rows_csv():
+        # stream in 1000-row batches: memory stays at one batch and the
+        # first byte leaves before the query finishes. ORDER BY id walks
+        # the primary key instead of sorting on created_at. The pooled
+        # connection keeps SQLite's page cache warm across exports.
+        async with pooled_connection() as conn:
+            cur = await conn.execute("SELECT discord_id, token, status, used, created_at, expires_at FROM verifications ORDER BY id")
+            buf = StringIO()
+            cw = csv.writer(buf)
+            cw.writerow(["discord_id", "token", "status", "used", "created_at", "expires_at"])
+            yield buf.getvalue()
+            while True:
+                batch = await cur.fetchmany(1000)
+                if not batch:
+                    break
+                buf = StringIO()
+                csv.writer(buf).writerows(batch)
+                yield buf.getvalue()
+
+    return app.response_class(rows_csv(), mimetype="text/csv")
 
 @app.route("/")
-def index():
+async def index():
     return "AegisX-S Verification server running."
 
 if __name__ == "__main__":